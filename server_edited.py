@@ -1,83 +1,326 @@
-from flask import Flask, request, jsonify, send_from_directory
-import requests, os
+from flask import Flask, Response, request, jsonify, send_from_directory
+import atexit
+import httpx
+import logging
+import os
+import orjson
+import re
+import threading
 import time
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
 
 # Create the Flask app
 app = Flask(__name__)
+# jsonify (used for error bodies) would otherwise pretty-print and sort keys in debug mode
+app.json.compact = True
+app.json.sort_keys = False
+# Let browsers reuse dashboard.html for 5 minutes, then revalidate via ETag/Last-Modified
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 300
+_DASHBOARD_DIR = os.path.abspath(os.getcwd())
 
 # --- 1. SECURE CONFIGURATION ---
-# Access the API key from the Codespaces Environment Variable
-DIMENSIONS_API_KEY = os.environ.get("DIMENSIONS_API_KEY") 
-if not DIMENSIONS_API_KEY:
-    # IMPORTANT: Ensure your Codespaces Secret is named "DIMENSIONS_API_KEY"
-    raise ValueError("FATAL ERROR: DIMENSIONS_API_KEY environment variable not set or found!")
+# The API key is read from the Codespaces Environment Variable "DIMENSIONS_API_KEY"
+# on first use, so importing this module never needs the key or the network.
+DIMENSIONS_AUTH_URL = os.environ.get("DIMENSIONS_AUTH_URL", "https://app.dimensions.ai/api/auth")
+DIMENSIONS_DSL_URL = os.environ.get("DIMENSIONS_DSL_URL", "https://app.dimensions.ai/api/dsl/v2")
+_AUTH_POST_HEADERS = {"Content-Type": "application/json"}
 
 # --- 2. GLOBAL STATE for Token Management ---
-# Use global state to cache the token and its expiry time
-token_data = {'token': None, 'expiry_time': 0}
-AUTH_URL = 'https://app.dimensions.ai/api/auth'
-DSL_URL = 'https://app.dimensions.ai/api/dsl/v2'
-
-def get_fresh_token():
-    """Checks if the current token is valid; if not, fetches a new one."""
-    # Give a 5-minute buffer (300 seconds) before expiration
-    if token_data['token'] and token_data['expiry_time'] > time.time() + 300:
-        return token_data['token']
-
-    print("🔑 Token expired or missing. Requesting new token...")
+# Use global state to cache [token, refresh deadline]; a list keeps cache reads to
+# one unpack instead of two keyed lookups, and is replaced in one slice assignment
+_DIMENSIONS_TOKEN_CACHE = [None, 0]
+_TOKEN_LOCK = threading.Lock()
+# [deadline, message] of the last failed refresh: fail fast until the deadline instead
+# of re-hitting the auth endpoint. Like the token cache, both slots change together.
+_AUTH_FAILURE = [0, None]
+
+# Deadlines are integer nanoseconds on the monotonic clock, so they are immune to
+# wall-clock jumps. Dimensions tokens usually last 1 hour; refresh 5 minutes early.
+_NS_PER_SECOND = 1_000_000_000
+_TOKEN_LIFETIME_NS = (3600 - 300) * _NS_PER_SECOND
+_AUTH_FAILURE_BACKOFF_NS = 5 * _NS_PER_SECOND
+
+# --- 3. SHARED HTTP CLIENT ---
+# One pooled HTTP/2 client for every upstream call: the auth POST and the DSL POST
+# reuse kept-alive TLS connections, and concurrent DSL queries are multiplexed
+# over a single connection instead of queueing behind each other.
+# No explicit transport is passed: httpx only honours HTTPS_PROXY and friends
+# when it builds the transports itself.
+_HTTP = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=16, max_connections=32),
+    timeout=30.0,
+)
+atexit.register(_HTTP.close)
+
+
+class DimensionsServiceError(Exception):
+    """Raised when Dimensions answers with a non-success HTTP status."""
+
+    def __init__(self, status, body):
+        super().__init__(f"Dimensions returned HTTP {status}")
+        self.status = status
+        self.body = body
+
+
+def _http_post(url, payload=None, *, headers=None, timeout=10):
+    """POSTs ``payload`` through the shared client and returns the raw response bytes.
+
+    ``headers`` is sent as given, so callers pass a complete, prebuilt header dict.
+    """
+    if isinstance(payload, (dict, list)):
+        data = orjson.dumps(payload)
+    elif isinstance(payload, str):
+        data = payload.encode("utf-8")
+    else:
+        data = payload
+
+    response = _HTTP.post(url, content=data, headers=headers, timeout=timeout)
+    if response.status_code >= 400:
+        raise DimensionsServiceError(response.status_code, response.content)
+    return response.content
+
+
+def _read_str_fields(*names):
+    """Parses the JSON request body and returns the named fields as stripped strings.
+
+    A field is ``None`` when it is missing or blank, and every field is ``None`` when
+    the body is not a JSON object. A field of any other type raises ``ValueError``.
+    """
+    # cache=False: the body is read exactly once, so Werkzeug need not keep a copy
+    try:
+        payload = orjson.loads(request.get_data(cache=False) or b"{}")
+    except orjson.JSONDecodeError:
+        payload = None
+    if not isinstance(payload, dict):
+        return (None,) * len(names)
+
+    fields = []
+    for name in names:
+        value = payload.get(name)
+        if value is None:
+            fields.append(None)
+        elif isinstance(value, str):
+            fields.append(value.strip() or None)
+        else:
+            raise ValueError(f"Field '{name}' must be a string.")
+    return tuple(fields)
+
+
+def _fetch_dimensions_token(http_post):
+    """Exchanges the API key for a new JWT."""
+    api_key = os.environ.get("DIMENSIONS_API_KEY")
+    if not api_key:
+        raise RuntimeError("Dimensions API key is not configured.")
+
+    logger.info("🔑 Token expired or missing. Requesting new token...")
     try:
-        login = {'key': DIMENSIONS_API_KEY}
-        resp = requests.post(AUTH_URL, json=login)
-        resp.raise_for_status()
-        
-        data = resp.json()
-        new_token = data['token']
-        # Dimensions tokens usually last 1 hour (3600 seconds)
-        token_data['token'] = new_token
-        token_data['expiry_time'] = time.time() + 3600 
-        print("✅ New token secured.")
-        return new_token
-    except Exception as e:
-        print(f"❌ Failed to get new token: {e}")
-        return None 
+        response_body = http_post(DIMENSIONS_AUTH_URL, {"key": api_key},
+                                  headers=_AUTH_POST_HEADERS, timeout=10)
+    except (DimensionsServiceError, httpx.HTTPError) as exc:
+        raise RuntimeError(f"Dimensions authentication failed: {exc}") from exc
+
+    try:
+        token = orjson.loads(response_body)["token"]
+    except (ValueError, KeyError, TypeError) as exc:
+        raise RuntimeError("Dimensions authentication returned invalid JSON.") from exc
+
+    logger.info("✅ New token secured.")
+    return token
+
+
+def _get_dimensions_token(*, http_post=None, time_func=time.monotonic_ns):
+    """Returns a cached JWT, requesting a new one once the current token is near expiry."""
+    now = time_func()
+    token, expires_at = _DIMENSIONS_TOKEN_CACHE
+    # The refresh buffer is folded into the deadline when the token is stored,
+    # so a cache hit costs a single comparison.
+    if token and now < expires_at:
+        return token
+    failed_until, failure_message = _AUTH_FAILURE
+    if now < failed_until:
+        raise RuntimeError(failure_message)
+
+    # Single-flight refresh: concurrent requests that miss the cache queue on the
+    # lock, and all but the first find the fresh token on the re-check.
+    with _TOKEN_LOCK:
+        token, expires_at = _DIMENSIONS_TOKEN_CACHE
+        if token and now < expires_at:
+            return token
+        failed_until, failure_message = _AUTH_FAILURE
+        if now < failed_until:
+            raise RuntimeError(failure_message)
+
+        try:
+            token = _fetch_dimensions_token(http_post or _http_post)
+        except RuntimeError as exc:
+            _AUTH_FAILURE[:] = [now + _AUTH_FAILURE_BACKOFF_NS, str(exc)]
+            raise
+        _AUTH_FAILURE[:] = [0, None]
+        _DIMENSIONS_TOKEN_CACHE[:] = [token, now + _TOKEN_LIFETIME_NS]
+        return token
+
+
+@lru_cache(maxsize=1)
+def _dsl_headers(token):
+    """Builds the DSL request headers once per token; callers must not mutate them."""
+    return {"Authorization": f"JWT {token}", "Content-Type": "application/json"}
+
 
 @app.route("/api/dimensions", methods=["POST"])
 def dimensions_proxy():
-    query = request.json.get("query", "")
-    jwt_token = get_fresh_token() # Ensures the token is always fresh
-    
-    if not jwt_token:
+    try:
+        (query,) = _read_str_fields("query")
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if query is None:
+        return jsonify({"error": "Missing DSL query payload."}), 400
+    logger.debug("Dimensions query: %s", query)
+
+    try:
+        jwt_token = _get_dimensions_token()  # Ensures the token is always fresh
+    except RuntimeError as exc:
         # If token acquisition fails, return a 500 error
-        return jsonify({"error": "Failed to authenticate with Dimensions API."}), 500
+        return jsonify({"error": "Unable to authenticate with Dimensions.",
+                        "details": str(exc)}), 500
+
+    try:
+        response_body = _http_post(DIMENSIONS_DSL_URL, query,
+                                   headers=_dsl_headers(jwt_token), timeout=30)
+    except DimensionsServiceError as exc:
+        logger.warning("🔍 Dimensions API status: %s", exc.status)
+        # Only the error path needs text; decode just the excerpt that is returned
+        excerpt = exc.body[:100].decode("utf-8", "replace")
+        try:
+            details = orjson.loads(exc.body).get("error", excerpt)
+        except (ValueError, AttributeError):
+            details = excerpt
+        return jsonify({"error": f"Dimensions API Error: {exc.status}",
+                        "details": details}), exc.status
+    except httpx.HTTPError as exc:
+        return jsonify({"error": "Could not reach Dimensions.", "details": str(exc)}), 502
+
+    # The dashboard only needs the upstream JSON, so forward the bytes untouched
+    # rather than parsing and re-encoding them. A leading-byte check is enough
+    # to catch non-JSON bodies (e.g., an HTML error page).
+    if response_body.lstrip()[:1] not in (b"{", b"["):
+        return jsonify({"error": "Invalid or unexpected non-JSON response from Dimensions",
+                        "details": response_body[:100].decode("utf-8", "replace")}), 502
+    return Response(response_body, status=200, mimetype="application/json",
+                    direct_passthrough=True)
+
+
+# --- 4. OPPORTUNITY PREDICTIONS ---
+# Terms are spliced into a pre-serialized JSON template, so only characters that
+# never need JSON escaping are accepted. The patterns are applied with fullmatch():
+# an "^...$" pattern with match() would also let a trailing newline through.
+_TERM_PATTERN = re.compile(r"[\w \-']{1,64}")
+_PERIOD_PATTERN = re.compile(r"\w{1,16}")
+
+
+# Candidate challenges as (title template, recommended collaborators)
+_CHALLENGES = (
+    ("{term} for climate resilience", (
+        "Grantham Institute - Climate Change and the Environment",
+        "Department of Civil and Environmental Engineering",
+    )),
+    ("{term} in precision healthcare", (
+        "School of Public Health",
+        "Data Science Institute",
+    )),
+    ("Responsible deployment of {term}", (
+        "Imperial College Business School",
+        "Institute for Security Science and Technology",
+    )),
+)
+
+
+# Per-challenge weights over the term feature vector, one row per _CHALLENGES entry.
+# The mock has a single constant feature, so each row is that challenge's confidence.
+_CHALLENGE_WEIGHTS = ((0.82,), (0.74,), (0.61,))
+
 
-    headers = {
-        'Authorization': f"JWT {jwt_token}",
-        "Content-Type": "application/json"
+def _term_features(term, period):
+    """Maps a term and period to the model's feature vector (constant for the mock)."""
+    return (1.0,)
+
+
+def _score_challenges(term_vec, challenge_mat):
+    """Returns one score per row of ``challenge_mat``: its dot product with ``term_vec``.
+
+    Only numbers go in and out, and the body is plain index loops, so an in-process
+    model can pass NumPy arrays and compile this function with numba unchanged.
+    """
+    scores = []
+    for i in range(len(challenge_mat)):
+        score = 0.0
+        for j in range(len(term_vec)):
+            score += challenge_mat[i][j] * term_vec[j]
+        scores.append(score)
+    return scores
+
+
+def _generate_mock_predictions(term, period):
+    """Builds placeholder predictions; a real model will replace the features and weights."""
+    scores = _score_challenges(_term_features(term, period), _CHALLENGE_WEIGHTS)
+    return {
+        "term": term,
+        "period": period,
+        "predictions": [
+            {
+                "challenge": title.format(term=term),
+                "confidence": score,
+                "recommended_collaborators": list(collaborators),
+            }
+            for (title, collaborators), score in zip(_CHALLENGES, scores)
+        ],
     }
 
-    res = requests.post(DSL_URL, data=query.encode(), headers=headers)
-    
-    print("🔍 Dimensions API status:", res.status_code)
 
+# The payload only varies by term and period, so serialize it once and
+# substitute the two placeholders per request. The placeholders contain "<" and
+# ">", which _TERM_PATTERN and _PERIOD_PATTERN reject, so user input can never
+# inject one. This stops holding once _term_features depends on its inputs.
+_PREDICTION_TEMPLATE_BYTES = orjson.dumps(_generate_mock_predictions("<TERM>", "<PERIOD>"))
+
+
+@lru_cache(maxsize=256)
+def _render_predictions(term, period):
+    return (_PREDICTION_TEMPLATE_BYTES
+            .replace(b"<TERM>", term.encode("utf-8"))
+            .replace(b"<PERIOD>", period.encode("utf-8")))
+
+
+@app.route("/api/opportunity-predictions", methods=["POST"])
+def opportunity_predictions():
     try:
-        # Check for non-200 status codes even if JSON is returned
-        if res.status_code != 200:
-             return jsonify({"error": f"Dimensions API Error: {res.status_code}",
-                        "details": res.json().get('error', res.text[:100])}), res.status_code
-        return jsonify(res.json())
-    except requests.exceptions.JSONDecodeError:
-        # Handle cases where Dimensions returns a non-JSON error (e.g., HTML error page)
-        return jsonify({"error": "Invalid or unexpected non-JSON response from Dimensions",
-                        "status": res.status_code,
-                        "details": res.text[:100]}), 502
-    except Exception as e:
-        return jsonify({"error": f"An unknown error occurred on the server: {e}"}), 500
+        term, period = _read_str_fields("term", "period")
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if term is None:
+        return jsonify({"error": "Missing required field: term"}), 400
+    if not _TERM_PATTERN.fullmatch(term):
+        return jsonify({"error": "Invalid term: use letters, digits, spaces, hyphens or "
+                                 "apostrophes (up to 64 characters)."}), 400
+
+    period = period or "all"
+    if not _PERIOD_PATTERN.fullmatch(period):
+        return jsonify({"error": "Invalid period."}), 400
+
+    return Response(_render_predictions(term, period), mimetype="application/json",
+                    direct_passthrough=True)
+
 
 @app.route('/')
 def serve_dashboard():
-    # Serves dashboard.html from the current directory
-    return send_from_directory(os.getcwd(), 'dashboard.html')
+    # Serves dashboard.html from the directory the server was started in;
+    # conditional requests get a 304 without re-reading the file
+    return send_from_directory(_DASHBOARD_DIR, 'dashboard.html', conditional=True)
 
 if __name__ == "__main__":
+    # WARNING keeps per-request logging quiet; set LOG_LEVEL=DEBUG to trace queries
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "WARNING"))
     # Ensure this script is run in an environment where DIMENSIONS_API_KEY is set
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -1,50 +1,100 @@
 from __future__ import annotations
 
+import importlib
+import json
 import sys
 import types
 from pathlib import Path
-from typing import Any, Callable, Dict, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import pytest
 
 
 class _StubRequest:
     """Minimal stand-in for :mod:`flask`'s ``request`` proxy used in tests."""
 
+    # The readers are per-instance closures, so calling one is a slot read
+    # rather than a bound-method lookup through the class.
+    __slots__ = ("_json_payload", "get_json", "get_data")
+
     def __init__(self) -> None:
         self._json_payload: Dict[str, Any] | None = None
+        self.get_json = lambda force=False, _req=self: _req._json_payload
+        self.get_data = lambda cache=True, _req=self: (
+            b"" if _req._json_payload is None else json.dumps(_req._json_payload).encode("utf-8")
+        )
 
     def set_json(self, payload: Dict[str, Any] | None) -> None:
         self._json_payload = payload
 
-    def get_json(self, force: bool = False) -> Dict[str, Any] | None:  # noqa: D401
-        return self._json_payload
+
+class _StubResponse:
+    """Captures the arguments :class:`flask.Response` is constructed with."""
+
+    def __init__(
+        self,
+        response: Any = None,
+        status: int | None = None,
+        mimetype: str | None = None,
+        **kwargs: Any,
+    ) -> None:
+        self.response = response
+        self.status_code = status or 200
+        self.mimetype = mimetype
+        self.kwargs = kwargs
 
 
 class _StubFlask:
+    _DEFAULT_METHODS: Tuple[str, ...] = ("GET",)
+
     def __init__(self, import_name: str) -> None:  # noqa: D401
         self.import_name = import_name
         self.config: Dict[str, Any] = {}
-        self._routes: Dict[Tuple[str, Tuple[str, ...]], Callable[..., Any]] = {}
+        self.json = types.SimpleNamespace(compact=None, sort_keys=True)
+        self._routes: List[Tuple[str, Tuple[str, ...], Callable[..., Any]]] = []
 
     def route(self, rule: str, methods: Tuple[str, ...] | None = None):  # noqa: D401
-        methods = methods or ("GET",)
+        methods = methods or self._DEFAULT_METHODS
+        if not isinstance(methods, tuple):
+            methods = tuple(methods)
 
         def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
-            self._routes[(rule, tuple(methods))] = func
+            self._routes.append((rule, methods, func))
             return func
 
         return decorator
 
 
-_stub_module = types.ModuleType("flask")
 _stub_request = _StubRequest()
-_stub_module.Flask = _StubFlask
-_stub_module.jsonify = lambda payload: payload
-_stub_module.request = _stub_request
-_stub_module.send_from_directory = lambda directory, filename: (directory, filename)
-_stub_module.__dict__["request_context"] = None
 
-sys.modules.setdefault("flask", _stub_module)
+# Build the stub only once per interpreter (e.g. per xdist worker)
+if sys.modules.get("flask") is None:
+    _stub_module = types.ModuleType("flask")
+    _stub_module.__dict__.update(
+        Flask=_StubFlask,
+        Response=_StubResponse,
+        jsonify=lambda payload: payload,
+        request=_stub_request,
+        send_from_directory=lambda directory, filename, **kwargs: (directory, filename, kwargs),
+        request_context=None,
+    )
+    sys.modules["flask"] = _stub_module
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
+
+# Import the app once, against the stubs above, before any test module is collected
+_server = importlib.import_module("server_edited")
+
+
+@pytest.fixture(scope="session")
+def server() -> types.ModuleType:
+    return _server
+
+
+@pytest.fixture(autouse=True)
+def _reset_stub_request() -> Iterator[None]:
+    """Clear the stub request body after every test."""
+    yield
+    _stub_request._json_payload = None
@@ -1,22 +1,30 @@
-import json
-from typing import Any, Dict
+import importlib.util
+import socket
+import threading
+from types import ModuleType
+from typing import Any, Iterator, Tuple
 
 import pytest
 
-import server_edited as server
+
+@pytest.fixture(autouse=True, scope="module")
+def _api_key() -> Iterator[None]:
+    """Configure a dummy API key once for the whole module."""
+    with pytest.MonkeyPatch.context() as monkeypatch_module:
+        monkeypatch_module.setenv("DIMENSIONS_API_KEY", "secret")
+        yield
 
 
 @pytest.fixture(autouse=True)
-def reset_cache(monkeypatch: pytest.MonkeyPatch):
-    """Ensure the module-level cache is clear between tests."""
-    server._DIMENSIONS_TOKEN_CACHE["token"] = None
-    server._DIMENSIONS_TOKEN_CACHE["expires_at"] = 0.0
-    yield
-    server._DIMENSIONS_TOKEN_CACHE["token"] = None
-    server._DIMENSIONS_TOKEN_CACHE["expires_at"] = 0.0
+def reset_cache(server: ModuleType, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Give each test a fresh module-level cache; monkeypatch restores the original."""
+    monkeypatch.setattr(server, "_DIMENSIONS_TOKEN_CACHE", [None, 0])
+    monkeypatch.setattr(server, "_AUTH_FAILURE", [0, None])
 
 
-def test_get_dimensions_token_requires_api_key(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_get_dimensions_token_requires_api_key(
+    server: ModuleType, monkeypatch: pytest.MonkeyPatch
+) -> None:
     monkeypatch.delenv("DIMENSIONS_API_KEY", raising=False)
 
     with pytest.raises(RuntimeError) as excinfo:
@@ -26,50 +34,133 @@ def test_get_dimensions_token_requires_api_key(monkeypatch: pytest.MonkeyPatch)
 
 
 class StubHttpPost:
+    # Pre-encoded auth responses; call n returns _RESPONSES[n - 1]
+    _RESPONSES: Tuple[str, ...] = tuple(f'{{"token": "token-{i}"}}' for i in range(1, 16))
+
     def __init__(self) -> None:
         self.calls = 0
-        self.payloads: Dict[str, Any] = {}
+        self.last_url: str | None = None
+        self.last_payload: Any = None
+        self.last_headers: Any = None
 
     def __call__(self, url: str, payload: Any = None, *, headers=None, timeout: int = 10) -> str:
         self.calls += 1
-        self.payloads[url] = payload
-        return json.dumps({"token": f"token-{self.calls}"})
+        self.last_url = url
+        self.last_payload = payload
+        self.last_headers = headers
+        return self._RESPONSES[self.calls - 1]
 
 
-def test_get_dimensions_token_caches_success(monkeypatch: pytest.MonkeyPatch) -> None:
-    monkeypatch.setenv("DIMENSIONS_API_KEY", "secret")
+def test_get_dimensions_token_caches_success(server: ModuleType) -> None:
     stub_http = StubHttpPost()
 
-    first = server._get_dimensions_token(http_post=stub_http, time_func=lambda: 0.0)
-    second = server._get_dimensions_token(http_post=stub_http, time_func=lambda: 5.0)
-    third = server._get_dimensions_token(http_post=stub_http, time_func=lambda: 4000.0)
+    first = server._get_dimensions_token(http_post=stub_http, time_func=lambda: 0)
+    second = server._get_dimensions_token(http_post=stub_http, time_func=lambda: 5_000_000_000)
+    third = server._get_dimensions_token(http_post=stub_http, time_func=lambda: 4_000_000_000_000)
 
     assert first == "token-1"
     assert second == "token-1"
     assert third == "token-2"
     assert stub_http.calls == 2
-    assert stub_http.payloads[server.DIMENSIONS_AUTH_URL] == {"key": "secret"}
+    assert stub_http.last_url == server.DIMENSIONS_AUTH_URL
+    assert stub_http.last_payload == {"key": "secret"}
+    assert stub_http.last_headers is server._AUTH_POST_HEADERS
+
+
+def test_get_dimensions_token_refreshes_inside_buffer(server: ModuleType) -> None:
+    stub_http = StubHttpPost()
+
+    server._get_dimensions_token(http_post=stub_http, time_func=lambda: 0)
+    before_buffer = server._get_dimensions_token(http_post=stub_http, time_func=lambda: 3_299_000_000_000)
+    inside_buffer = server._get_dimensions_token(http_post=stub_http, time_func=lambda: 3_300_000_000_000)
+
+    assert before_buffer == "token-1"
+    assert inside_buffer == "token-2"
+
+
+def test_get_dimensions_token_coalesces_concurrent_refreshes(server: ModuleType) -> None:
+    stub_http = StubHttpPost()
+    entered = threading.Event()
+    release = threading.Event()
+
+    def slow_http_post(*args, **kwargs):
+        entered.set()
+        release.wait(timeout=1)
+        return stub_http(*args, **kwargs)
+
+    results = []
+
+    def worker() -> None:
+        results.append(server._get_dimensions_token(http_post=slow_http_post, time_func=lambda: 0))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    entered.wait(timeout=1)
+    release.set()
+    for thread in threads:
+        thread.join()
 
+    assert results == ["token-1"] * 4
+    assert stub_http.calls == 1
 
-def test_get_dimensions_token_handles_invalid_json(monkeypatch: pytest.MonkeyPatch) -> None:
-    monkeypatch.setenv("DIMENSIONS_API_KEY", "secret")
 
-    def bad_http_post(*args, **kwargs):
-        return "not-json"
+def _return_invalid_json(*args, **kwargs):
+    return "not-json"
 
+
+def _raise_service_error(*args, **kwargs):
+    from server_edited import DimensionsServiceError
+
+    raise DimensionsServiceError(500, b"oops")
+
+
+@pytest.mark.parametrize(
+    "http_post, message",
+    [
+        (_return_invalid_json, "invalid JSON"),
+        (_raise_service_error, "Dimensions authentication failed"),
+    ],
+)
+def test_get_dimensions_token_errors(server: ModuleType, http_post, message: str) -> None:
     with pytest.raises(RuntimeError) as excinfo:
-        server._get_dimensions_token(http_post=bad_http_post)
+        server._get_dimensions_token(http_post=http_post)
 
-    assert "invalid JSON" in str(excinfo.value)
+    assert message in str(excinfo.value)
 
 
-def test_get_dimensions_token_wraps_service_error(monkeypatch: pytest.MonkeyPatch) -> None:
-    monkeypatch.setenv("DIMENSIONS_API_KEY", "secret")
+def test_get_dimensions_token_backs_off_after_failure(server: ModuleType) -> None:
+    calls = []
 
     def raising_http_post(*args, **kwargs):
-        raise server.DimensionsServiceError(500, "oops")
+        calls.append(args)
+        raise server.DimensionsServiceError(503, b"unavailable")
 
-    with pytest.raises(RuntimeError) as excinfo:
-        server._get_dimensions_token(http_post=raising_http_post)
+    for now in (0, 4_000_000_000, 5_000_000_000):
+        with pytest.raises(RuntimeError) as excinfo:
+            server._get_dimensions_token(http_post=raising_http_post, time_func=lambda: now)
+        assert "Dimensions authentication failed" in str(excinfo.value)
+
+    assert len(calls) == 2
+
+    stub_http = StubHttpPost()
+    assert server._get_dimensions_token(http_post=stub_http, time_func=lambda: 10_000_000_000) == "token-1"
+    assert server._AUTH_FAILURE == [0, None]
+
+
+def test_module_import_is_offline_and_keyless(
+    server: ModuleType, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.delenv("DIMENSIONS_API_KEY", raising=False)
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("server_edited must not open connections at import time")
+
+    monkeypatch.setattr(socket.socket, "connect", no_network)
+    monkeypatch.setattr(socket, "create_connection", no_network)
+
+    spec = importlib.util.spec_from_file_location("_server_import_check", server.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
 
-    assert "Dimensions authentication failed" in str(excinfo.value)
+    assert module._DIMENSIONS_TOKEN_CACHE == [None, 0]
@@ -1,74 +1,192 @@
+import gzip
 import json
-from typing import Any
+from types import ModuleType
+from typing import Any, Dict
 
+import httpx
 import pytest
 
-import server_edited as server
-
 
 def _as_body_status(result):
     """Normalise Flask-style return values for assertions."""
 
-    if isinstance(result, tuple):
+    if type(result) is tuple:
         body, status = result
         return body, status
+    if hasattr(result, "response"):
+        return json.loads(result.response), result.status_code
     return result, 200
 
 
-def test_dimensions_proxy_missing_query() -> None:
+@pytest.fixture(scope="module")
+def query_payload() -> Dict[str, str]:
+    return {"query": "search records"}
+
+
+@pytest.fixture(scope="module")
+def success_response() -> bytes:
+    return json.dumps({"results": [1, 2, 3]}).encode("utf-8")
+
+
+def test_dimensions_proxy_missing_query(server: ModuleType) -> None:
     server.request.set_json({})  # type: ignore[attr-defined]
     response_body, status = _as_body_status(server.dimensions_proxy())
-    server.request.set_json(None)  # type: ignore[attr-defined]
     assert status == 400
     assert response_body["error"] == "Missing DSL query payload."
 
 
-def test_dimensions_proxy_success(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_dimensions_proxy_invalid_json_body(
+    server: ModuleType, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(server.request, "get_data", lambda cache=True: b"{not json")
+    response_body, status = _as_body_status(server.dimensions_proxy())
+    assert status == 400
+    assert response_body["error"] == "Missing DSL query payload."
+
+
+def test_dimensions_proxy_success(
+    server: ModuleType,
+    monkeypatch: pytest.MonkeyPatch,
+    query_payload: Dict[str, str],
+    success_response: bytes,
+) -> None:
     monkeypatch.setenv("DIMENSIONS_API_KEY", "secret")
     monkeypatch.setattr(server, "_get_dimensions_token", lambda **kwargs: "cached-token")
 
-    def fake_http_post(url: str, payload: Any = None, *, headers=None, timeout: int = 10) -> str:
+    def fake_http_post(url: str, payload: Any = None, *, headers=None, timeout: int = 10) -> bytes:
         assert headers["Authorization"] == "JWT cached-token"
         assert timeout == 30
-        return json.dumps({"results": [1, 2, 3]})
+        return success_response
 
     monkeypatch.setattr(server, "_http_post", fake_http_post)
 
-    server.request.set_json({"query": "search records"})  # type: ignore[attr-defined]
+    server.request.set_json(query_payload)  # type: ignore[attr-defined]
     response, status = _as_body_status(server.dimensions_proxy())
-    server.request.set_json(None)  # type: ignore[attr-defined]
 
     assert status == 200
     assert response == {"results": [1, 2, 3]}
 
 
-def test_dimensions_proxy_handles_token_error(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_dimensions_proxy_rejects_non_json_body(
+    server: ModuleType, monkeypatch: pytest.MonkeyPatch, query_payload: Dict[str, str]
+) -> None:
+    monkeypatch.setattr(server, "_get_dimensions_token", lambda **kwargs: "cached-token")
+    monkeypatch.setattr(server, "_http_post", lambda *args, **kwargs: b"<html>Bad gateway</html>")
+
+    server.request.set_json(query_payload)  # type: ignore[attr-defined]
+    response_body, status = _as_body_status(server.dimensions_proxy())
+
+    assert status == 502
+    assert response_body["details"] == "<html>Bad gateway</html>"
+
+
+def test_http_post_requests_and_decodes_gzip(
+    server: ModuleType, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def handler(req: httpx.Request) -> httpx.Response:
+        assert "gzip" in req.headers["Accept-Encoding"]
+        return httpx.Response(
+            200,
+            content=gzip.compress(b'{"results": []}'),
+            headers={"Content-Encoding": "gzip"},
+        )
+
+    # Reuse the module client's default headers so the handler sees what it would send
+    with httpx.Client(transport=httpx.MockTransport(handler), headers=server._HTTP.headers) as client:
+        monkeypatch.setattr(server, "_HTTP", client)
+        body = server._http_post(server.DIMENSIONS_DSL_URL, "search records")
+
+    assert body == b'{"results": []}'
+
+
+def test_dimensions_proxy_reports_upstream_error(
+    server: ModuleType, monkeypatch: pytest.MonkeyPatch, query_payload: Dict[str, str]
+) -> None:
+    monkeypatch.setattr(server, "_get_dimensions_token", lambda **kwargs: "cached-token")
+
+    def failing_http_post(*args, **kwargs):
+        raise server.DimensionsServiceError(400, b'{"error": "Semantic Error"}')
+
+    monkeypatch.setattr(server, "_http_post", failing_http_post)
+
+    server.request.set_json(query_payload)  # type: ignore[attr-defined]
+    response_body, status = _as_body_status(server.dimensions_proxy())
+
+    assert status == 400
+    assert response_body["details"] == "Semantic Error"
+
+
+def test_dimensions_proxy_handles_token_error(
+    server: ModuleType, monkeypatch: pytest.MonkeyPatch
+) -> None:
     def raising_token(**kwargs):  # type: ignore[no-untyped-def]
         raise RuntimeError("boom")
 
     monkeypatch.setattr(server, "_get_dimensions_token", raising_token)
     server.request.set_json({"query": "anything"})  # type: ignore[attr-defined]
     response_body, status = _as_body_status(server.dimensions_proxy())
-    server.request.set_json(None)  # type: ignore[attr-defined]
 
     assert status == 500
     assert response_body["error"] == "Unable to authenticate with Dimensions."
     assert response_body["details"] == "boom"
 
 
-def test_opportunity_predictions_success() -> None:
+def test_opportunity_predictions_success(server: ModuleType) -> None:
     server.request.set_json({"term": "AI", "period": "5"})  # type: ignore[attr-defined]
     response, status = _as_body_status(server.opportunity_predictions())
-    server.request.set_json(None)  # type: ignore[attr-defined]
     assert status == 200
     assert response["term"] == "AI"
     assert response["period"] == "5"
     assert len(response["predictions"]) == 3
 
 
-def test_opportunity_predictions_requires_term() -> None:
+def test_opportunity_predictions_requires_term(server: ModuleType) -> None:
     server.request.set_json({"period": "5"})  # type: ignore[attr-defined]
     response_body, status = _as_body_status(server.opportunity_predictions())
-    server.request.set_json(None)  # type: ignore[attr-defined]
     assert status == 400
     assert response_body["error"] == "Missing required field: term"
+
+
+def test_opportunity_predictions_rejects_non_string_period(server: ModuleType) -> None:
+    server.request.set_json({"term": "AI", "period": 5})  # type: ignore[attr-defined]
+    response_body, status = _as_body_status(server.opportunity_predictions())
+    assert status == 400
+    assert response_body["error"] == "Field 'period' must be a string."
+
+
+@pytest.mark.parametrize("fields", [("AI\n", "5"), ("AI", "5\n")])
+def test_opportunity_predictions_rejects_trailing_newline(
+    server: ModuleType, monkeypatch: pytest.MonkeyPatch, fields
+) -> None:
+    # Bypass the strip in _read_str_fields so only the validators stand in the way
+    monkeypatch.setattr(server, "_read_str_fields", lambda *names: fields)
+    response_body, status = _as_body_status(server.opportunity_predictions())
+    assert status == 400
+
+
+def test_opportunity_predictions_rejects_unsafe_term(server: ModuleType) -> None:
+    server.request.set_json({"term": 'AI"}, "x": "', "period": "5"})  # type: ignore[attr-defined]
+    response_body, status = _as_body_status(server.opportunity_predictions())
+    assert status == 400
+    assert response_body["error"].startswith("Invalid term")
+
+
+def test_opportunity_predictions_fills_template(server: ModuleType) -> None:
+    server.request.set_json({"term": "machine learning"})  # type: ignore[attr-defined]
+    response, status = _as_body_status(server.opportunity_predictions())
+    assert status == 200
+    assert response == server._generate_mock_predictions("machine learning", "all")
+
+
+def test_opportunity_predictions_term_matching_placeholder(server: ModuleType) -> None:
+    server.request.set_json({"term": "__PERIOD__", "period": "x"})  # type: ignore[attr-defined]
+    response, status = _as_body_status(server.opportunity_predictions())
+    assert status == 200
+    assert response == server._generate_mock_predictions("__PERIOD__", "x")
+
+
+def test_serve_dashboard_is_cacheable(server: ModuleType) -> None:
+    directory, filename, kwargs = server.serve_dashboard()
+    assert (directory, filename) == (server._DASHBOARD_DIR, "dashboard.html")
+    assert kwargs["conditional"] is True
+    assert server.app.config["SEND_FILE_MAX_AGE_DEFAULT"] == 300